@@ -1,117 +1,346 @@
+import asyncio
+import io
+import json
 import os
 import shutil
+import aiofiles
+import numpy as np
+import piexif
 from exifread import process_file
+from collections import deque
+from dataclasses import dataclass
 from datetime import datetime
-from fractions import Fraction
+from functools import lru_cache
+from itertools import islice
 from tqdm import tqdm
 import time
-
-def extract_metadata(folder_path):
-    def parse_date(date_str):
-        """Parse EXIF date string into a datetime object."""
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+PHOTO_EXTENSIONS = frozenset({'nef', 'jpg', 'jpeg', 'png'})
+PIEXIF_MAGIC = (b'\xff\xd8', b'II', b'MM')  # JPEG and TIFF-based (NEF) files
+HEADER_SIZE = 128 * 1024  # EXIF lives at the start of the file
+EXTRACT_CHUNK_SIZE = 32  # Photos per worker task, also the number of concurrent header reads
+CACHE_FILE_NAME = '.hdr_grouper_cache.json'
+GROUP_BATCH_SIZE = 256  # Photos per vectorized boundary check
+HDR_SET_SIZES = frozenset({3, 5, 7, 9})  # Bracketing sizes accepted as an HDR set
+BIAS_TOLERANCE = 1e-6  # Exposure biases are compared as floats
+MOVE_WORKERS = 8  # Concurrent copies and renames
+TQDM_OPTIONS = {'mininterval': 0.5, 'miniters': 100, 'smoothing': 0.05}  # Fewer progress bar redraws
+
+@dataclass
+class Photos:
+    """Photo metadata stored as parallel arrays."""
+    names: list  # File names
+    dates: np.ndarray  # datetime64[s], NaT when the date is missing
+    biases: np.ndarray  # float32, NaN when the exposure bias is missing
+
+    @classmethod
+    def from_lists(cls, names, dates, biases):
+        return cls(names, np.array(dates, dtype='datetime64[s]'), np.array(biases, dtype=np.float32))
+
+    @classmethod
+    def concat(cls, parts):
+        if not parts:
+            return cls.from_lists([], [], [])
+        return cls([name for part in parts for name in part.names],
+                   np.concatenate([part.dates for part in parts]),
+                   np.concatenate([part.biases for part in parts]))
+
+    def __len__(self):
+        return len(self.names)
+
+    def __getitem__(self, index):
+        if not isinstance(index, slice):
+            raise TypeError(f"Photos only supports slicing, not {type(index).__name__} indices")
+        return Photos(self.names[index], self.dates[index], self.biases[index])
+
+    def take(self, indices):
+        return Photos([self.names[i] for i in indices], self.dates[indices], self.biases[indices])
+
+@lru_cache(maxsize=None)
+def parse_date(date_str):
+    """Parse EXIF date string into a datetime object."""
+    try:
+        return datetime.strptime(date_str, '%Y:%m:%d %H:%M:%S')
+    except Exception:
+        return None
+
+@lru_cache(maxsize=64)
+def parse_exposure_bias(value):
+    """Parse exposure bias value as a float."""
+    try:
+        num, _, den = value.partition('/')
+        return float(num) / float(den) if den else float(num)
+    except (ValueError, ZeroDivisionError):
+        return None
+
+def parse_exif_tags(data):
+    """Parse the raw DateTimeOriginal string and exposure bias from image bytes."""
+    if data[:2] in PIEXIF_MAGIC:
         try:
-            return datetime.strptime(date_str, '%Y:%m:%d %H:%M:%S')
+            exif = piexif.load(data)['Exif']
+            date_taken = exif.get(piexif.ExifIFD.DateTimeOriginal)  # 36867
+            exposure_bias = exif.get(piexif.ExifIFD.ExposureBiasValue)  # 37380, SRATIONAL (num, den)
+
+            return (date_taken.decode('ascii') if date_taken else None,
+                    exposure_bias[0] / exposure_bias[1] if exposure_bias and exposure_bias[1] else None)
         except Exception:
-            return None
+            pass  # Broken header or non-ASCII date, exifread is more lenient
+
+    # piexif only understands JPEG/TIFF-based files, fall back to exifread (e.g. PNG)
+    tags = process_file(io.BytesIO(data), details=False, stop_tag='ExposureBiasValue')
+
+    date_taken = tags.get('EXIF DateTimeOriginal')
+    exposure_bias = tags.get('EXIF ExposureBiasValue')
+
+    return (str(date_taken) if date_taken else None,
+            parse_exposure_bias(str(exposure_bias)) if exposure_bias else None)
+
+async def read_header(file_path):
+    """Read the header of a photo without blocking the event loop."""
+    async with aiofiles.open(file_path, 'rb') as f:
+        return await f.read(HEADER_SIZE)
+
+async def read_headers(file_paths):
+    """Read the headers of a chunk of photos concurrently, None for those that fail."""
+    headers = await asyncio.gather(*(read_header(file_path) for file_path in file_paths),
+                                   return_exceptions=True)
+    return [header if isinstance(header, bytes) else None for header in headers]
+
+def read_exif_tags(file_path, header=None):
+    """Read the EXIF tags of a photo, looking at the file header first."""
+    if header is None:
+        with open(file_path, 'rb') as f:
+            header = f.read(HEADER_SIZE)
+
+    if len(header) < HEADER_SIZE:  # The whole file fits in the header
+        return parse_exif_tags(header)
+
+    try:
+        tags = parse_exif_tags(header)
+        if None not in tags:
+            return tags
+    except Exception:
+        pass  # EXIF points past the header, retry with the whole file
+
+    with open(file_path, 'rb') as f:
+        return parse_exif_tags(f.read())
+
+def is_photo(file_name):
+    """Check whether a file name has one of the supported photo extensions."""
+    _, dot, ext = file_name.rpartition('.')
+    return bool(dot) and ext.lower() in PHOTO_EXTENSIONS
+
+def extract_one(file_path, header=None):
+    """Extract the (date taken, exposure bias) of a single photo, or None if it can't be read."""
+    try:
+        date_taken, exposure_bias = read_exif_tags(file_path, header)
+
+        return (parse_date(date_taken) if date_taken else None,
+                exposure_bias if exposure_bias is not None else np.nan)
+
+    except Exception:
+        return None  # Suppress error messages
+
+def extract_chunk(file_paths):
+    """Extract the metadata of a chunk of photos, reading their headers concurrently."""
+    headers = asyncio.run(read_headers(file_paths))
+    return [extract_one(file_path, header) for file_path, header in zip(file_paths, headers)]
+
+def extract_pending(executor, file_paths):
+    """Yield the metadata of the given photos in order, one chunk per worker task."""
+    chunks = (file_paths[start:start + EXTRACT_CHUNK_SIZE]
+              for start in range(0, len(file_paths), EXTRACT_CHUNK_SIZE))
+
+    # Keep every worker busy, but only submit more as results are consumed
+    in_flight = deque(executor.submit(extract_chunk, chunk)
+                      for chunk in islice(chunks, 2 * (os.cpu_count() or 1)))
+    while in_flight:
+        results = in_flight.popleft().result()
+        for chunk in islice(chunks, 1):
+            in_flight.append(executor.submit(extract_chunk, chunk))
+        yield from results
+
+def load_cache(folder_path):
+    """Load the EXIF cache of a previous run, or an empty one."""
+    try:
+        with open(os.path.join(folder_path, CACHE_FILE_NAME), 'r') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def save_cache(folder_path, cache):
+    """Write the EXIF cache back into the folder."""
+    try:
+        with open(os.path.join(folder_path, CACHE_FILE_NAME), 'w') as f:
+            json.dump(cache, f)
+    except OSError:
+        pass  # Read-only folder, the next run just parses again
+
+def iter_metadata(folder_path):
+    """Yield the metadata of all photos in the folder in file name order, in batches."""
+    cache = load_cache(folder_path)
+    new_cache = {}
+    pending = []
+
+    with os.scandir(folder_path) as it:
+        entries = [e for e in it if is_photo(e.name)]
+    entries.sort(key=lambda e: e.name)  # Sort by file name
+
+    files = []  # (name, cache key, cache hit or None), looked up once per file
+    for entry in entries:
+        st = entry.stat(follow_symlinks=False)
+        key = [st.st_mtime_ns, st.st_size]
+
+        # Cache entries are [mtime_ns, size, date taken, exposure bias]
+        cached = cache.get(entry.name)
+        if not cached or cached[:2] != key:
+            cached = None
+            pending.append(entry.path)
+        files.append((entry.name, key, cached))
+
+    names, dates, biases = [], [], []
+    with ProcessPoolExecutor(max_workers=os.cpu_count()) as executor:
+        # Results come back in submission order, i.e. sorted like the entries
+        results = extract_pending(executor, pending)
+
+        for name, key, cached in tqdm(files, desc="Extracting metadata", unit="file", **TQDM_OPTIONS):
+            if cached:
+                date_taken = parse_date(cached[2]) if cached[2] else None
+                exposure_bias = parse_exposure_bias(cached[3]) if cached[3] else None
+                new_cache[name] = cached
+            else:
+                data = next(results)
+                if data is None:
+                    continue
+                date_taken, exposure_bias = data
+                new_cache[name] = key + [
+                    date_taken.strftime('%Y:%m:%d %H:%M:%S') if date_taken else None,
+                    str(exposure_bias) if not np.isnan(exposure_bias) else None
+                ]
 
-    def parse_exposure_bias(value):
-        """Parse exposure bias value as a fraction."""
-        try:
-            if '/' in value:
-                return Fraction(value)
-            return Fraction(float(value))
-        except ValueError:
-            return None
+            names.append(name)
+            dates.append(date_taken)
+            biases.append(exposure_bias if exposure_bias is not None else np.nan)
 
-    files_data = []
+            if len(names) == GROUP_BATCH_SIZE:
+                yield Photos.from_lists(names, dates, biases)
+                names, dates, biases = [], [], []
 
-    for file_name in tqdm(os.listdir(folder_path), desc="Extracting metadata", unit="file"):
-        if file_name.lower().endswith(('.nef', '.jpg', '.jpeg', '.png')):
-            file_path = os.path.join(folder_path, file_name)
+    if names:
+        yield Photos.from_lists(names, dates, biases)
 
-            try:
-                with open(file_path, 'rb') as f:
-                    tags = process_file(f, details=False)
+    save_cache(folder_path, new_cache)
 
-                date_taken = tags.get('EXIF DateTimeOriginal')
-                exposure_bias = tags.get('EXIF ExposureBiasValue')
+def extract_metadata(folder_path):
+    """Extract metadata from all photos in the folder using a process pool."""
+    return Photos.concat(list(iter_metadata(folder_path)))
+
+def stream_groups(batches):
+    """Yield runs of photos taken within 3 seconds of each other as soon as they close."""
+    pieces = []  # Parts of the open group, from one or more batches
+
+    for batch in batches:
+        if not len(batch):
+            continue
+
+        # Prepend the last photo of the open group so a boundary at the batch start is seen
+        window = Photos.concat([pieces[-1][-1:], batch]) if pieces else batch
+        offset = len(window) - len(batch)
+        has_date = ~np.isnat(window.dates)
+        gaps = np.diff(window.dates.view('i8'))  # Seconds, without copying the datetime64[s] array
+
+        # Start a new group when the time difference exceeds 3 seconds or a date is missing
+        breaks = (gaps > 3) | ~has_date[1:] | ~has_date[:-1]
+
+        start = 0
+        for split in np.flatnonzero(breaks) + 1 - offset:
+            pieces.append(batch[start:split])
+            yield Photos.concat(pieces)
+            pieces = []
+            start = split
+        pieces.append(batch[start:])
+
+    if pieces:
+        yield Photos.concat(pieces)
+
+def validate_group(group):
+    """Split and validate a group, returning the HDR sets found in it."""
+    biases = group.biases[~np.isnan(group.biases)]
+    if len(biases) <= 9 and len(biases) not in HDR_SET_SIZES:
+        return []  # Can never form an HDR set, skip looking at the biases
+
+    unique_biases = np.unique(biases)
+    valid_groups = []
 
-                files_data.append({
-                    'File Name': file_name,
-                    'Date Taken': parse_date(str(date_taken)) if date_taken else None,
-                    'Exposure Bias': parse_exposure_bias(str(exposure_bias)) if exposure_bias else None
-                })
+    if len(unique_biases) > 1:  # Ensure at least two distinct exposure biases
+        min_bias = unique_biases[0]
+        max_bias = unique_biases[-1]
+
+        if max_bias - min_bias > 3 + BIAS_TOLERANCE:  # Ensure the range of biases is greater than 3
+            if len(biases) > 9:  # Split into smaller subgroups if too large
+                for i in range(0, len(biases), 9):
+                    subgroup = group[i:i + 9]
+                    if len(subgroup) in HDR_SET_SIZES:
+                        valid_groups.append(subgroup)
+            elif len(biases) in HDR_SET_SIZES:
+                # Consecutive biases must be within a margin of 2
+                if np.all(np.diff(np.sort(biases)) <= 2 + BIAS_TOLERANCE):
+                    valid_groups.append(group)
 
-            except Exception:
-                pass  # Suppress error messages
+    return valid_groups
 
-    return files_data
+def iter_hdr_groups(batches):
+    """Yield the HDR sets found in batches of photos sorted by file name."""
+    for group in stream_groups(batches):
+        yield from validate_group(group)
 
-def group_hdr_photos(photo_data):
+def group_hdr_photos(photos):
     """Group photos into HDR sets based on relaxed time difference and exposure bias."""
-    photo_data.sort(key=lambda x: x['File Name'])  # Sort by file name
+    photos = photos.take(np.argsort(photos.names, kind='stable'))  # Sort by file name
 
-    def is_within_margin(bias1, bias2, margin=Fraction(2)):
-        return abs(bias1 - bias2) <= margin
+    return list(iter_hdr_groups([photos]))
 
-    hdr_groups = []
-    temp_group = []
+def move_hdr_group(executor, folder_path, group_index, group):
+    """Create the subfolder of one HDR group and submit its copy and moves."""
+    base = os.path.join(folder_path, '')  # Ends with a separator, names are appended directly
+    group_folder = f"{base}HDR_Group_{group_index:02}"
+    os.makedirs(group_folder, exist_ok=True)
+    group_base = group_folder + os.sep
 
-    for i in range(len(photo_data)):
-        current = photo_data[i]
+    futures = []
+    for i, name in enumerate(group.names):
+        source_path = base + name
+        target_path = group_base + name
 
-        if i > 0:
-            prev = photo_data[i - 1]
+        if i == 0:
+            futures.append(executor.submit(shutil.copyfile, source_path, target_path))  # Copy the first photo
+        else:
+            futures.append(executor.submit(os.replace, source_path, target_path))  # Move the rest, same filesystem
 
-            # Compare time difference (relaxed to 3 seconds)
-            time_diff = (current['Date Taken'] - prev['Date Taken']).total_seconds() if current['Date Taken'] and prev['Date Taken'] else float('inf')
+    return futures
 
-            if temp_group and time_diff > 3:
-                hdr_groups.append(temp_group)
-                temp_group = []
-
-        temp_group.append(current)
-
-    if temp_group:
-        hdr_groups.append(temp_group)
-
-    # Split and validate groups
-    valid_groups = []
-    for group in hdr_groups:
-        biases = [photo['Exposure Bias'] for photo in group if photo['Exposure Bias'] is not None]
-        unique_biases = set(biases)
-
-        if len(unique_biases) > 1:  # Ensure at least two distinct exposure biases
-            min_bias = min(unique_biases)
-            max_bias = max(unique_biases)
-
-            if max_bias - min_bias > 3:  # Ensure the range of biases is greater than 3
-                if len(biases) > 9:  # Split into smaller subgroups if too large
-                    for i in range(0, len(biases), 9):
-                        subgroup = group[i:i + 9]
-                        if len(subgroup) in {3, 5, 7, 9}:
-                            valid_groups.append(subgroup)
-                elif len(biases) in {3, 5, 7, 9}:
-                    biases.sort()
-                    if all(is_within_margin(biases[i], biases[i + 1]) for i in range(len(biases) - 1)):
-                        valid_groups.append(group)
+def move_hdr_photos(folder_path, hdr_groups):
+    """Move and copy HDR photos into group subfolders as the groups arrive, returning the group count."""
+    group_count = 0
+    futures = deque()
 
-    return valid_groups
+    # The pool is shut down (and all moves finished) before the progress bar closes
+    with tqdm(desc="Moving HDR photos", unit="file", **TQDM_OPTIONS) as progress, \
+            ThreadPoolExecutor(max_workers=MOVE_WORKERS) as executor:
+        for group_count, group in enumerate(hdr_groups, start=1):
+            for future in move_hdr_group(executor, folder_path, group_count, group):
+                future.add_done_callback(lambda _: progress.update())
+                futures.append(future)
 
-def move_hdr_photos(folder_path, hdr_groups):
-    """Move and copy HDR photos into group subfolders."""
-    for group_index, group in enumerate(tqdm(hdr_groups, desc="Moving HDR photos", unit="group"), start=1):
-        group_folder = os.path.join(folder_path, f"HDR_Group_{group_index:02}")
-        os.makedirs(group_folder, exist_ok=True)
+            # Release finished moves so only the ones still running are held
+            while futures and futures[0].done():
+                futures.popleft().result()
 
-        for i, photo in enumerate(group):
-            source_path = os.path.join(folder_path, photo['File Name'])
-            target_path = os.path.join(group_folder, photo['File Name'])
+        for future in futures:
+            future.result()
 
-            if i == 0:
-                shutil.copy(source_path, target_path)  # Copy the first photo
-            else:
-                shutil.move(source_path, target_path)  # Move the rest
+    return group_count
 
 # Main function to run the script
 def main():
@@ -123,14 +352,13 @@ def main():
 
     start_time = time.time()
 
-    photo_data = extract_metadata(folder_path)
-    hdr_groups = group_hdr_photos(photo_data)
-    move_hdr_photos(folder_path, hdr_groups)
+    # Groups are moved as soon as they close, while later photos are still being read
+    hdr_group_count = move_hdr_photos(folder_path, iter_hdr_groups(iter_metadata(folder_path)))
 
     end_time = time.time()
 
     print(f"\nProcessing completed.")
-    print(f"Total HDR groups created: {len(hdr_groups)}")
+    print(f"Total HDR groups created: {hdr_group_count}")
     print(f"Total processing time: {end_time - start_time:.2f} seconds.")
 
 if __name__ == "__main__":
@@ -12,7 +12,10 @@ setup(
     packages=find_packages(),
     py_modules=["HDR_Grouper_v10"],
     install_requires=[
+        "aiofiles",
         "exifread",
+        "numpy",
+        "piexif",
         "tqdm",
         "icecream"
     ],
@@ -22,7 +25,7 @@ setup(
         "Operating System :: OS Independent",
         "Topic :: Multimedia :: Graphics :: Graphics Conversion",
     ],
-    python_requires=">=3.6",
+    python_requires=">=3.7",
     entry_points={
         "console_scripts": [
             "hdr-grouper=HDR_Grouper_v10:main",